@@ -62,6 +62,69 @@ def clean_firestore_data(data):
         return data
 
 
+# ✅ Timeline por usuario (índice materializado de requests)
+# Cada request se replica como una entrada resumida en
+# user_timelines/{email}/entries/{request_id}_{role}, con role "sent" para el
+# creador y "received" para el asignado. Se escribe en el mismo batch que el
+# request, así los listados leen un índice pequeño y ordenado en lugar de
+# consultar y filtrar toda la colección "request".
+# Requiere el índice compuesto (entries: role ASC, date_created DESC).
+TIMELINE_COLLECTION = "user_timelines"
+TIMELINE_ROLES = {"sent": "creator_user", "received": "user_asigned"}
+
+
+def timeline_entries_ref(email):
+    return db.collection(TIMELINE_COLLECTION).document(email.lower()).collection("entries")
+
+
+def add_timeline_writes(batch, request_id, data):
+    """Agrega al batch las entradas de timeline del creador y del asignado."""
+    for role, owner_field in TIMELINE_ROLES.items():
+        owner = data.get(owner_field)
+        if not owner:
+            continue
+        entry = {
+            "request_id": request_id,
+            "role": role,
+            "subject": data.get("subject", ""),
+            "creator_user": data.get("creator_user", ""),
+            "user_asigned": data.get("user_asigned", ""),
+            "status": data.get("status", "pending"),
+            "date_created": data.get("date_created"),
+        }
+        if "date_updated" in data:
+            entry["date_updated"] = data["date_updated"]
+        batch.set(timeline_entries_ref(owner).document(f"{request_id}_{role}"), entry)
+
+
+def get_timeline_page(email, role, searched_value, search_fields, page, page_size):
+    """Devuelve (resultados, total) del timeline del usuario, ordenado por fecha."""
+    query = timeline_entries_ref(email)
+    if role:
+        query = query.where("role", "==", role)
+    query = query.order_by("date_created", direction=firestore.Query.DESCENDING)
+    start = (page - 1) * page_size
+
+    if searched_value:
+        # La búsqueda por subcadena no se puede hacer en Firestore; se filtra
+        # sobre las entradas resumidas, que son pequeñas.
+        entries = [
+            e for e in (doc.to_dict() for doc in query.stream())
+            if any(searched_value in (e.get(f) or "").lower() for f in search_fields)
+        ]
+        total = len(entries)
+        entries = entries[start:start + page_size]
+    else:
+        total = query.count().get()[0][0].value
+        entries = [doc.to_dict() for doc in query.offset(start).limit(page_size).get()]
+
+    results = []
+    for e in entries:
+        request_id = e.pop("request_id")
+        results.append(clean_firestore_data({"id": request_id, **e}))
+    return results, total
+
+
 # ✅ Obtener remitentes (remitters)
 @app.route("/remitters", methods=["GET", "OPTIONS"])
 def get_remitters():
@@ -228,11 +291,15 @@ def update_request_status(request_id):
         if not new_status or new_status not in ["answered", "pending", "rejected"]: # Puedes agregar más estados
             return jsonify({"error": "Invalid or missing status in request body. Must be 'answered', 'pending', or 'rejected'."}), 400
 
-        # 5. Actualizar el campo 'status'
-        doc_ref.update({
+        # 5. Actualizar el campo 'status' y el timeline de ambos usuarios en el mismo batch
+        changes = {
             "status": new_status,
             "date_updated": firestore.SERVER_TIMESTAMP # Opcional: agregar una marca de tiempo de actualización
-        })
+        }
+        batch = db.batch()
+        batch.update(doc_ref, changes)
+        add_timeline_writes(batch, request_id, {**doc.to_dict(), **changes})
+        batch.commit()
 
         return jsonify({
             "message": f"Request status updated successfully to '{new_status}'",
@@ -305,7 +372,12 @@ def create_request():
             "status": "pending"  # ← 🔥 estado inicial agregado
         }
 
-        db.collection("request").add(doc_data)
+        # ✅ Guardar el request y su entrada en el timeline de cada usuario en un solo batch
+        request_ref = db.collection("request").document()
+        batch = db.batch()
+        batch.set(request_ref, doc_data)
+        add_timeline_writes(batch, request_ref.id, doc_data)
+        batch.commit()
 
         doc_data_response = clean_firestore_data(doc_data)
 
@@ -343,42 +415,12 @@ def get_requests():
         page = int(request.args.get("page", 1))
         page_size = int(request.args.get("page_size", 10))
 
-        collection_ref = db.collection("request")
-        query_creator = collection_ref.where("creator_user", "==", email_logged).get()
-        query_assigned = collection_ref.where("user_asigned", "==", email_logged).get()
-
-        all_requests = [
-            {
-                "id": doc.id,
-                **doc.to_dict(),
-                "status": doc.to_dict().get("status", "pending")
-            }
-            for doc in query_creator
-        ] + [
-            {
-                "id": doc.id,
-                **doc.to_dict(),
-                "status": doc.to_dict().get("status", "pending")
-            }
-            for doc in query_assigned
-        ]
-
-        # 🔍 Filtro
-        if searched_value:
-            all_requests = [
-                r for r in all_requests
-                if searched_value in r.get("subject", "").lower()
-                or searched_value in r.get("creator_user", "").lower()
-                or searched_value in r.get("user_asigned", "").lower()
-            ]
-
-        # 📄 Paginación
-        total = len(all_requests)
+        # ✅ Timeline del usuario (enviadas y recibidas), ordenado por fecha
+        paginated_clean, total = get_timeline_page(
+            email_logged, None, searched_value,
+            ("subject", "creator_user", "user_asigned"), page, page_size
+        )
         total_pages = (total + page_size - 1) // page_size
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated = all_requests[start:end]
-        paginated_clean = [clean_firestore_data(r) for r in paginated]
 
         return jsonify({
             "response": {
@@ -414,29 +456,11 @@ def get_requests_sent():
         page = int(request.args.get("page", 1))
         page_size = int(request.args.get("page_size", 10))
 
-        query_creator = db.collection("request").where("creator_user", "==", email_logged).get()
-        requests_sent = [
-            {
-                "id": doc.id,
-                **doc.to_dict(),
-                "status": doc.to_dict().get("status", "pending")
-            }
-            for doc in query_creator
-        ]
-
-        if searched_value:
-            requests_sent = [
-                r for r in requests_sent
-                if searched_value in r.get("subject", "").lower()
-                or searched_value in r.get("user_asigned", "").lower()
-            ]
-
-        total = len(requests_sent)
+        paginated_clean, total = get_timeline_page(
+            email_logged, "sent", searched_value,
+            ("subject", "user_asigned"), page, page_size
+        )
         total_pages = (total + page_size - 1) // page_size
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated = requests_sent[start:end]
-        paginated_clean = [clean_firestore_data(r) for r in paginated]
 
         return jsonify({
             "response": {
@@ -473,32 +497,12 @@ def get_requests_received():
         page = int(request.args.get("page", 1))
         page_size = int(request.args.get("page_size", 10))
 
-        # ✅ Solo solicitudes asignadas al usuario logueado
-        query_assigned = db.collection("request").where("user_asigned", "==", email_logged).get()
-        requests_received = [{"id": doc.id, **doc.to_dict()} for doc in query_assigned]
-
-        # 🔍 Búsqueda
-        if searched_value:
-            requests_received = [
-                r for r in requests_received
-                if searched_value in r.get("subject", "").lower()
-                or searched_value in r.get("creator_user", "").lower()
-            ]
-
-        # 📄 Paginación
-        total = len(requests_received)
+        # ✅ Solo solicitudes asignadas al usuario logueado (el estado viene en la entrada del timeline)
+        enriched_requests, total = get_timeline_page(
+            email_logged, "received", searched_value,
+            ("subject", "creator_user"), page, page_size
+        )
         total_pages = (total + page_size - 1) // page_size
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated = requests_received[start:end]
-
-        # ✅ Agregar el estado correspondiente de la colección "status"
-        enriched_requests = []
-        for r in paginated:
-            status_ref = db.collection("status").where("id_request", "==", r["id"]).get()
-            status_data = status_ref[0].to_dict() if status_ref else {"status": "unknown"}
-            r["status"] = status_data.get("status")
-            enriched_requests.append(clean_firestore_data(r))
 
         return jsonify({
             "response": {
@@ -656,6 +660,28 @@ def logout():
     return jsonify({"message": "Sesión cerrada correctamente (client-side)"}), 200
 
 
+# ✅ Reconstruir timelines a partir de la colección "request"
+# Uso: flask --app main rebuild-timelines
+@app.cli.command("rebuild-timelines")
+def rebuild_timelines():
+    """Regenera las entradas de timeline de todos los requests existentes."""
+    batch = db.batch()
+    pending = 0
+    total = 0
+    for doc in db.collection("request").stream():
+        add_timeline_writes(batch, doc.id, doc.to_dict())
+        pending += len(TIMELINE_ROLES)
+        total += 1
+        # Firestore permite máximo 500 escrituras por batch
+        if pending >= 500 - len(TIMELINE_ROLES):
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    print(f"✅ Timelines reconstruidos para {total} requests")
+
+
 # ✅ Ejecutar servidor
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))